@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounded concurrency limit with a bounded wait queue.
+
+    At most ``limit`` requests run at once and at most ``max_queue`` wait
+    for a slot; a request that waits longer than ``max_wait`` seconds is
+    shed. The limit adapts to measured latency (AIMD): it grows by roughly
+    one per ``limit`` completions while the smoothed latency stays under
+    ``target_latency`` and is cut by ``backoff`` when it goes over, at most
+    once per window of ``limit`` completions so one slow burst doesn't
+    collapse it.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=32, max_queue=16,
+                 max_wait=10.0, target_latency=20.0, backoff=0.75, smoothing=0.2):
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.smoothed_latency = None
+        self._active = 0
+        self._waiting = 0
+        self._shed = 0
+        self._admitted = 0
+        self._since_decrease = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout=None):
+        """Wait for a slot for at most ``max_wait`` (or ``timeout`` if shorter)."""
+        with self._condition:
+            if self._active < int(self.limit):
+                self._active += 1
+                self._admitted += 1
+                return
+
+            if self._waiting >= self.max_queue:
+                self._shed += 1
+                raise AdmissionRejected("queue full", self.retry_after())
+
+            self._waiting += 1
+            max_wait = self.max_wait if timeout is None else min(self.max_wait, timeout)
+            deadline = time.monotonic() + max_wait
+            try:
+                while self._active >= int(self.limit):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._shed += 1
+                        raise AdmissionRejected("queue wait exceeded", self.retry_after())
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._active += 1
+            self._admitted += 1
+
+    def release(self, latency):
+        with self._condition:
+            self._active -= 1
+            if self.smoothed_latency is None:
+                self.smoothed_latency = latency
+            else:
+                self.smoothed_latency += self.smoothing * (latency - self.smoothed_latency)
+
+            self._since_decrease += 1
+            new_limit = self.limit
+            if self.smoothed_latency > self.target_latency:
+                if self._since_decrease >= int(self.limit):
+                    new_limit = max(self.min_limit, self.limit * self.backoff)
+                    self._since_decrease = 0
+            else:
+                new_limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if int(new_limit) != int(self.limit):
+                logger.info(f"Admission limit changed to {int(new_limit)} "
+                            f"(smoothed latency {self.smoothed_latency:.2f}s)")
+            self.limit = new_limit
+            # Wake as many waiters as there are free slots under the new limit
+            self._condition.notify(max(1, int(self.limit) - self._active))
+
+    def retry_after(self):
+        # Roughly the time for the current backlog to drain, at least a second
+        latency = self.smoothed_latency or 1.0
+        backlog = (self._active + self._waiting) / max(int(self.limit), 1)
+        return max(1, math.ceil(latency * backlog))
+
+    def stats(self):
+        with self._condition:
+            return {
+                "limit": int(self.limit),
+                "active": self._active,
+                "waiting": self._waiting,
+                "admitted": self._admitted,
+                "shed": self._shed,
+                "smoothed_latency_seconds": round(self.smoothed_latency or 0.0, 3)
+            }
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, make_response
 from shared.db import DatabaseManager
 import openai
 import os
@@ -7,9 +7,18 @@ import requests
 from functools import wraps
 from datetime import datetime
 import logging
+import threading
+import time
 from werkzeug.middleware.proxy_fix import ProxyFix
 import torch
 from transformers import pipeline
+from deadline import Deadline, DeadlineExceeded
+from idempotency import IDEMPOTENCY_HEADER, IdempotencyStore, derive_key, explicit_key
+from admission import AdmissionController, AdmissionRejected
+from fleet_health import FleetHealthMonitor
+from conversation_memory import ConversationMemory
+from prompt_context import ToolContextBuilder
+from semantic_cache import SemanticCache, mean_pooled_embedding, tool_signature
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -33,6 +42,26 @@ classifier = pipeline("zero-shot-classification",
                     hypothesis_template="This tool can perform the task: {}.",
                     device=device)
 
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+# Responses that used a tool with any of these capabilities are never cached
+SEMANTIC_CACHE_SKIP_CAPABILITIES = set(
+    os.getenv('SEMANTIC_CACHE_SKIP_CAPABILITIES', 'news_search,current_events').split(',')
+)
+
+semantic_cache = None
+if SEMANTIC_CACHE_ENABLED:
+    logger.info("Semantic response cache enabled")
+    embedder = pipeline("feature-extraction",
+                        model=os.getenv('SEMANTIC_CACHE_MODEL', 'sentence-transformers/all-MiniLM-L6-v2'),
+                        device=device,
+                        # The model has a fixed number of positions; embed the start of long messages
+                        tokenize_kwargs={"truncation": True})
+    semantic_cache = SemanticCache(
+        embed=lambda text: mean_pooled_embedding(embedder(text)),
+        max_entries=int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '1000')),
+        ttl_seconds=int(os.getenv('SEMANTIC_CACHE_TTL_SECONDS', '3600')),
+        threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+    )
 
 
 app = Flask(__name__)
@@ -42,14 +71,201 @@ app.wsgi_app = ProxyFix(app.wsgi_app)
 def log_request():
     logger.info(f"Received {request.method} request to {request.path} from {request.remote_addr}")
 
+@app.before_request
+def set_deadline():
+    g.deadline = Deadline.from_headers(request.headers, REQUEST_TIMEOUT_SECONDS)
+
 @app.after_request
 def log_response(response):
     logger.info(f"Returning {response.status_code} to {request.remote_addr}")
     return response
 
-db = DatabaseManager()
+db = DatabaseManager(application_name='ai-agent')
 openai.api_key = os.getenv('OPENAI_API_KEY', 'your-api-key-here')
 
+CHAT_RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', '30'))
+CHAT_PARTITION_PREMAKE_DAYS = int(os.getenv('CHAT_PARTITION_PREMAKE_DAYS', '7'))
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('MAINTENANCE_INTERVAL_SECONDS', '3600'))
+SCHEMA_MIGRATION_RETRY_SECONDS = 10
+
+# Budget for requests that don't send a deadline header, and the cap for those that do
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', '60'))
+TOOL_TIMEOUT_SECONDS = float(os.getenv('TOOL_TIMEOUT_SECONDS', '5'))
+
+CONVERSATION_MEMORY_TURNS = int(os.getenv('CONVERSATION_MEMORY_TURNS', '3'))
+SUMMARY_MODEL = os.getenv('SUMMARY_MODEL', 'gpt-3.5-turbo')
+SUMMARY_MAX_TOKENS = int(os.getenv('SUMMARY_MAX_TOKENS', '300'))
+
+def summarize_conversation(summary, messages):
+    transcript = "\n".join(f"{m['role']}: {m['message']}" for m in messages)
+    response = openai.ChatCompletion.create(
+        model=SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": "Update the running summary of a conversation between a user and an AI assistant. Keep facts, names, numbers and open questions the assistant may need later. Reply with the updated summary only."},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+        ],
+        max_tokens=SUMMARY_MAX_TOKENS,
+        request_timeout=30
+    )
+    return response.choices[0].message.content
+
+# Set CONVERSATION_MEMORY_TURNS=0 to answer every message without prior context
+conversation_memory = None
+if CONVERSATION_MEMORY_TURNS > 0:
+    conversation_memory = ConversationMemory(
+        db_provider=lambda: db,
+        summarize=summarize_conversation,
+        keep_turns=CONVERSATION_MEMORY_TURNS,
+        max_unsummarized=int(os.getenv('CONVERSATION_MEMORY_MAX_UNSUMMARIZED', '20'))
+    )
+
+fleet_health = FleetHealthMonitor(
+    db_provider=lambda: db,
+    interval=int(os.getenv('FLEET_HEALTH_INTERVAL_SECONDS', '15')),
+    probe_timeout=float(os.getenv('FLEET_HEALTH_PROBE_TIMEOUT_SECONDS', '2')),
+    failure_threshold=int(os.getenv('FLEET_HEALTH_FAILURE_THRESHOLD', '2'))
+)
+
+tool_context_builder = ToolContextBuilder(
+    model="gpt-4",
+    tokens_per_tool=int(os.getenv('TOOL_CONTEXT_TOKENS_PER_TOOL', '800'))
+)
+
+ADMISSION_MAX_LIMIT = int(os.getenv('ADMISSION_MAX_LIMIT', '8'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '8'))
+# Admitted and queued chat requests each hold a server thread. Requests beyond
+# the worker's threads would wait in gunicorn's queue and never be shed, so
+# the limit and queue have to fit in the threads not reserved for health checks.
+if os.getenv('AGENT_THREADS'):
+    chat_threads = max(1, int(os.getenv('AGENT_THREADS')) - int(os.getenv('AGENT_RESERVED_THREADS', '4')))
+    ADMISSION_MAX_LIMIT = min(ADMISSION_MAX_LIMIT, chat_threads)
+    ADMISSION_MAX_QUEUE = min(ADMISSION_MAX_QUEUE, chat_threads - ADMISSION_MAX_LIMIT)
+
+admission = AdmissionController(
+    initial_limit=int(os.getenv('ADMISSION_INITIAL_LIMIT', '4')),
+    max_limit=ADMISSION_MAX_LIMIT,
+    max_queue=ADMISSION_MAX_QUEUE,
+    max_wait=float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', '10')),
+    target_latency=float(os.getenv('ADMISSION_TARGET_LATENCY_SECONDS', '20'))
+)
+
+def admission_controlled(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            admission.acquire(timeout=g.deadline.remaining())
+        except AdmissionRejected as e:
+            logger.warning(f"Shedding request: {e.reason}")
+            return jsonify({"error": f"Server overloaded: {e.reason}"}), 503, {
+                "Retry-After": str(e.retry_after)
+            }
+        started = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            admission.release(time.monotonic() - started)
+    return wrapper
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '600'))
+IDEMPOTENCY_POLL_SECONDS = 0.25
+
+idempotency = IdempotencyStore(
+    ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+    max_entries=int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '1000'))
+)
+
+def replay_response(result):
+    body, status, mimetype = result
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    response = make_response(body, status)
+    response.mimetype = mimetype
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def claim_or_wait(key, deadline):
+    """Claim the key across workers, or wait for the worker holding it.
+
+    Returns None once claimed, otherwise the result to replay.
+    """
+    while True:
+        if db.claim_idempotency_key(key, lease_seconds=REQUEST_TIMEOUT_SECONDS):
+            return None
+        stored = db.get_idempotency_result(key)
+        if stored not in (None, 'pending'):
+            logger.info("Replaying result computed by another worker")
+            return stored
+        # None means the holder gave up without a result; try to claim again
+        if stored == 'pending':
+            if deadline.expired():
+                return (jsonify({"error": "Deadline exceeded waiting for original request"}).get_data(),
+                        504, 'application/json')
+            time.sleep(min(IDEMPOTENCY_POLL_SECONDS, deadline.remaining()))
+
+def idempotent(func):
+    """Run duplicate requests once, keyed by Idempotency-Key or session and message.
+
+    Keys are claimed in the idempotency_keys table so duplicates landing on
+    other workers are coalesced too; the in-process store is a fast path.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key:
+            key = explicit_key(key)
+        else:
+            data = request.get_json(silent=True) or {}
+            if 'session_id' not in data or 'message' not in data:
+                return func(*args, **kwargs)
+            try:
+                latest_message_id = db.get_latest_chat_message_id(data['session_id'])
+            except Exception as e:
+                logger.error(f"Could not derive idempotency key, continuing without it: {e}")
+                return func(*args, **kwargs)
+            key = derive_key(data['session_id'], data['message'], latest_message_id)
+
+        role, value = idempotency.begin(key)
+        if role == IdempotencyStore.REPLAY:
+            logger.info("Replaying completed result for duplicate request")
+            return replay_response(value)
+        if role == IdempotencyStore.JOIN:
+            logger.info("Attaching duplicate request to in-flight computation")
+            if not value.done.wait(g.deadline.remaining()):
+                return jsonify({"error": "Deadline exceeded waiting for original request"}), 504
+            return replay_response(value.result)
+
+        result = (jsonify({"error": "Request failed"}).get_data(), 500, 'application/json')
+        try:
+            claimed = True
+            try:
+                stored = claim_or_wait(key, g.deadline)
+                if stored is not None:
+                    result = stored
+                    return replay_response(result)
+            except Exception as e:
+                # Without the shared claim we can still serve the request
+                logger.error(f"Idempotency claim failed, continuing without it: {e}")
+                claimed = False
+
+            try:
+                response = make_response(func(*args, **kwargs))
+                result = (response.get_data(), response.status_code, response.mimetype)
+            finally:
+                if claimed:
+                    try:
+                        if result[1] == 200:
+                            db.complete_idempotency_key(key, result[0].decode('utf-8'), result[1],
+                                                        result[2], IDEMPOTENCY_TTL_SECONDS)
+                        else:
+                            db.release_idempotency_key(key)
+                    except Exception as e:
+                        logger.error(f"Failed to record idempotency result: {e}")
+            return response
+        finally:
+            # Waiters always get the leader's result; only successes are replayed later
+            idempotency.finish(key, value, result, store=result[1] == 200)
+    return wrapper
+
 def retry_on_failure(max_retries=1):
     def decorator(func):
         @wraps(func)
@@ -58,6 +274,9 @@ def retry_on_failure(max_retries=1):
             while retries <= max_retries:
                 try:
                     return func(*args, **kwargs)
+                except DeadlineExceeded:
+                    # Retrying can't help once the request is out of time
+                    raise
                 except Exception as e:
                     retries += 1
                     if retries > max_retries:
@@ -78,12 +297,15 @@ def register_tool():
         name=data['name'],
         description=data['description'],
         endpoint_url=data['endpoint_url'],
-        capabilities=data['capabilities']
+        capabilities=data['capabilities'],
+        instance_id=data.get('instance_id')
     )
     
     return jsonify({"tool_id": tool_id, "status": "registered"})
 
 @app.route('/api/chat', methods=['POST'])
+@idempotent
+@admission_controlled
 def chat():
     try:
         data = request.json
@@ -92,17 +314,50 @@ def chat():
         
         message = data['message']
         session_id = data.get('session_id', str(uuid.uuid4()))
+        deadline = g.deadline
         
         logger.info(f"Processing chat request for session {session_id}")
         
-        # Get available tools
-        tools = db.get_active_tools()
+        # Get available tools, leaving out those failing their own health checks
+        tools = [tool for tool in db.get_active_tools() if fleet_health.is_healthy(tool['name'])]
         logger.info(f"Found {len(tools)} active tools")
         for tool in tools:
             logger.info(f"Available tool: {tool['name']} with capabilities: {tool['capabilities']}")
         
+        # Earlier turns of this conversation, bounded by the rolling summary
+        history_messages = []
+        memory_unavailable = False
+        if conversation_memory and 'session_id' in data:
+            deadline.check("loading conversation memory")
+            try:
+                history_messages = conversation_memory.build_messages(session_id)
+            except Exception as e:
+                logger.error(f"Could not load conversation memory, answering without it: {e}")
+                memory_unavailable = True
+
+        # Answer paraphrases of recently answered messages from the cache. Answers
+        # that depend on conversation context are neither served nor stored,
+        # as they would leak between sessions.
+        use_cache = semantic_cache is not None and not history_messages and not memory_unavailable
+        if use_cache:
+            deadline.check("semantic cache lookup")
+            started = time.monotonic()
+            try:
+                embedding = semantic_cache.embed(message)
+            except Exception as e:
+                # A failed embedding is a cache miss, not a failed request
+                logger.warning(f"Could not embed message, skipping semantic cache: {e}")
+                use_cache = False
+        if use_cache:
+            signature = tool_signature(tools)
+            cached_response = semantic_cache.lookup(embedding, signature)
+            if cached_response is not None:
+                store_chat_history(session_id, message, cached_response, deadline)
+                logger.info("Chat request answered from semantic cache")
+                return jsonify({"response": cached_response})
+
         # Process tool calls
-        tool_responses = process_tool_calls(message, tools)
+        tool_responses = process_tool_calls(message, tools, deadline)
         if tool_responses:
             logger.info("Tools used in response:")
             for resp in tool_responses:
@@ -114,12 +369,15 @@ def chat():
         system_message = create_system_message(tools)
         
         # Get initial response from OpenAI
+        deadline.check("initial completion")
         response = openai.ChatCompletion.create(
             model="gpt-4",
             messages=[
                 {"role": "system", "content": system_message},
+                *history_messages,
                 {"role": "user", "content": message}
-            ]
+            ],
+            request_timeout=deadline.timeout()
         )
         assistant_message = response.choices[0].message.content
         logger.info("Received initial response from OpenAI")
@@ -127,23 +385,43 @@ def chat():
         # If tools were used, get final response
         if tool_responses:
             logger.info("Getting final response incorporating tool results")
-            final_response = get_final_response(message, assistant_message, tool_responses)
+            final_response = get_final_response(message, assistant_message, tool_responses,
+                                                history_messages, deadline)
         else:
             logger.info("Using initial response (no tools used)")
             final_response = assistant_message
+
+        if use_cache and is_cacheable(tools, tool_responses):
+            semantic_cache.store(embedding, signature, final_response,
+                                 time.monotonic() - started)
         
         # Store chat history
-        db.create_session(session_id)
-        db.add_chat_message(session_id, message, "user")
-        db.add_chat_message(session_id, final_response, "assistant")
+        store_chat_history(session_id, message, final_response, deadline)
         
         logger.info("Chat request completed successfully")
         return jsonify({"response": final_response})
-        
+
+    except (DeadlineExceeded, openai.error.Timeout) as e:
+        logger.warning(f"Chat request ran out of time: {str(e)}")
+        return jsonify({"error": str(e)}), 504
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}", exc_info=True)
         return jsonify({"error": str(e)}), 500
 
+def store_chat_history(session_id, message, response, deadline):
+    deadline.check("storing chat history")
+    db.record_chat_exchange(session_id, message, response, timeout=deadline.timeout())
+    if conversation_memory:
+        conversation_memory.schedule_update(session_id)
+
+def is_cacheable(tools, tool_responses):
+    used = {resp['tool'] for resp in tool_responses}
+    for tool in tools:
+        if tool['name'] in used and SEMANTIC_CACHE_SKIP_CAPABILITIES.intersection(tool['capabilities']):
+            logger.info(f"Not caching response that used time-sensitive tool {tool['name']}")
+            return False
+    return True
+
 def create_system_message(tools):
     tool_descriptions = "\n".join([
         f"- {tool['name']}: {tool['description']}" 
@@ -157,7 +435,7 @@ When a user's request requires using these tools, incorporate them into your res
 If no tools are needed, respond directly to the user's query."""
 
 @retry_on_failure(max_retries=1)
-def process_tool_calls(message, tools):
+def process_tool_calls(message, tools, deadline):
     tool_responses = []
     candidate_labels = []
     tool_map = {}
@@ -174,6 +452,7 @@ def process_tool_calls(message, tools):
             candidate_labels.append(capability)
             tool_map[capability] = tool    # Map capability to the full tool object
 
+    deadline.check("tool routing")
     logger.info("Getting Classification Result")
     try:
         result = classifier(message, candidate_labels)   
@@ -192,12 +471,14 @@ def process_tool_calls(message, tools):
         selected_tool = tool_map[top_label]
         logger.info(f"Selected tool: {selected_tool['name']} with confidence: {top_score}")
         
+        deadline.check(f"calling {selected_tool['name']}")
         try:
             logger.info(f"Calling tool {selected_tool['name']} at {selected_tool['endpoint_url']}")
             response = requests.post(
                 selected_tool['endpoint_url'],
                 json={"query": message},
-                timeout=5
+                headers=deadline.headers(),
+                timeout=deadline.timeout(TOOL_TIMEOUT_SECONDS)
             )
             if response.status_code == 200:
                 logger.info(f"Successfully used {selected_tool['name']}")
@@ -214,19 +495,20 @@ def process_tool_calls(message, tools):
 
     return tool_responses
 
-def get_final_response(user_message, assistant_message, tool_responses):
-    tools_context = "\n".join([
-        f"{resp['tool']} returned: {resp['response']}"
-        for resp in tool_responses
-    ])
+def get_final_response(user_message, assistant_message, tool_responses, history_messages, deadline):
+    tools_context = tool_context_builder.build(tool_responses)
+    logger.info(f"Tool context uses {tool_context_builder.count_tokens(tools_context)} tokens")
     
+    deadline.check("final completion")
     response = openai.ChatCompletion.create(
         model="gpt-4",
         messages=[
+            *history_messages,
             {"role": "user", "content": user_message},
             {"role": "assistant", "content": assistant_message},
             {"role": "system", "content": f"Tool results:\n{tools_context}\nPlease provide a final response incorporating these tool results."}
-        ]
+        ],
+        request_timeout=deadline.timeout()
     )
     
     return response.choices[0].message.content
@@ -240,14 +522,18 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }
 
-        try:
-            logger.debug("Checking database connection")
-            db.get_active_tools()
-            status["database"] = "connected"
-            logger.debug("Database connection successful")
-        except Exception as e:
-            logger.error(f"Database connection failed: {e}")
-            status["database"] = f"error: {str(e)}"
+        # Served from the background snapshot; probes never hit the database
+        snapshot = fleet_health.snapshot
+        if snapshot is None:
+            status["database"] = "pending"
+        else:
+            status["database"] = snapshot["database"]
+            status["tools"] = snapshot["tools"]
+            status["checked_at"] = snapshot["timestamp"]
+            if fleet_health.is_stale():
+                status["fleet_status"] = "stale"
+
+        status["admission"] = admission.stats()
             
         return jsonify(status)
     except Exception as e:
@@ -258,6 +544,44 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@app.route('/api/sessions/<session_id>/messages', methods=['GET'])
+def chat_history(session_id):
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        before = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            before_timestamp, before_id = cursor.rsplit('|', 1)
+            before = (datetime.fromisoformat(before_timestamp), int(before_id))
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    try:
+        rows = db.get_chat_history(session_id, limit=limit, before=before)
+        next_cursor = None
+        if len(rows) == limit:
+            oldest = rows[-1]
+            next_cursor = f"{oldest['timestamp'].isoformat()}|{oldest['id']}"
+        messages = [{
+            "role": row['role'],
+            "content": row['message'],
+            "timestamp": row['timestamp'].isoformat()
+        } for row in reversed(rows)]
+        return jsonify({"messages": messages, "next_cursor": next_cursor})
+    except Exception as e:
+        logger.error(f"Error fetching chat history: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/db/stats', methods=['GET'])
+def db_stats():
+    return jsonify(db.pool_stats())
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    if not semantic_cache:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **semantic_cache.stats()})
+
 @app.route('/api/tools/heartbeat', methods=['POST'])
 def tool_heartbeat():
     try:
@@ -265,11 +589,58 @@ def tool_heartbeat():
         if not data or 'name' not in data:
             return jsonify({"error": "Tool name is required"}), 400
         
-        db.update_tool_heartbeat(data['name'])
+        if not db.update_tool_heartbeat(data['name']):
+            return jsonify({"error": "Tool not registered"}), 404
         return jsonify({"status": "ok"})
     except Exception as e:
         logger.error(f"Error updating tool heartbeat: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/tools/deregister', methods=['POST'])
+def deregister_tool():
+    try:
+        data = request.json
+        if not data or 'name' not in data:
+            return jsonify({"error": "Tool name is required"}), 400
+        
+        if not db.deregister_tool(data['name'], data.get('instance_id')):
+            # A newer instance has registered since; leave it active
+            logger.info(f"Ignoring deregistration of {data['name']} from a stale instance")
+            return jsonify({"status": "ignored"})
+        logger.info(f"Tool {data['name']} deregistered")
+        return jsonify({"status": "deregistered"})
+    except Exception as e:
+        logger.error(f"Error deregistering tool: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def start_background_tasks():
+    # Keep chat_history partitions ahead of time and prune expired data
+    threading.Thread(target=run_maintenance, daemon=True).start()
+    # Probe the registry and tool health endpoints for routing and /api/health
+    fleet_health.start()
+
+def run_maintenance():
+    # Bring databases created by older versions up to date before maintaining them
+    while True:
+        try:
+            db.migrate_schema()
+            break
+        except Exception as e:
+            logger.error(f"Schema migration failed, retrying: {e}")
+            time.sleep(SCHEMA_MIGRATION_RETRY_SECONDS)
+
+    while True:
+        try:
+            logger.info("Running chat history maintenance...")
+            db.run_chat_history_maintenance(
+                retention_days=CHAT_RETENTION_DAYS,
+                premake_days=CHAT_PARTITION_PREMAKE_DAYS
+            )
+        except Exception as e:
+            logger.error(f"Chat history maintenance failed: {e}")
+        time.sleep(MAINTENANCE_INTERVAL_SECONDS)
+
 if __name__ == '__main__':
+    start_background_tasks()
+
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationMemory:
+    """Bounded multi-turn context: a rolling summary plus the last few turns.
+
+    The last ``keep_turns`` exchanges are replayed verbatim. Anything older
+    is folded into the session's summary in the background after each
+    response, so prompt size stays bounded however long a session runs.
+    Older messages the summary doesn't cover yet, because the summarizer is
+    behind or failing, are replayed as well, up to ``max_unsummarized``.
+    """
+
+    def __init__(self, db_provider, summarize, keep_turns=3, max_message_chars=2000,
+                 max_unsummarized=20, max_workers=2):
+        # db_provider is called on use so workers pick up their own DatabaseManager
+        self.db_provider = db_provider
+        self.summarize = summarize
+        self.keep_turns = keep_turns
+        self.max_message_chars = max_message_chars
+        self.max_unsummarized = max_unsummarized
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='conversation-memory')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def build_messages(self, session_id):
+        """Chat messages to place before the new user message."""
+        db = self.db_provider()
+        summary, summarized_through_id = db.get_session_summary(session_id)
+        window = self.keep_turns * 2
+        rows = db.get_chat_history(session_id, limit=window + self.max_unsummarized)
+        # Newest first: the recent window plus older rows not in the summary yet
+        recent = [row for index, row in enumerate(rows)
+                  if index < window or row['id'] > (summarized_through_id or 0)]
+        if len(rows) == window + self.max_unsummarized and len(recent) == len(rows):
+            logger.warning(f"Session {session_id} has more than {self.max_unsummarized} "
+                           f"unsummarized messages; replaying only the newest")
+
+        messages = []
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}"
+            })
+        for row in reversed(recent):
+            content = row['message']
+            if len(content) > self.max_message_chars:
+                content = content[:self.max_message_chars] + "..."
+            messages.append({"role": row['role'], "content": content})
+        return messages
+
+    def schedule_update(self, session_id):
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+        self._executor.submit(self._update, session_id)
+
+    def _update(self, session_id):
+        try:
+            db = self.db_provider()
+            recent = db.get_chat_history(session_id, limit=self.keep_turns * 2)
+            if len(recent) < self.keep_turns * 2:
+                return
+
+            summary, summarized_through_id = db.get_session_summary(session_id)
+            oldest_recent_id = min(row['id'] for row in recent)
+            older = db.get_unsummarized_messages(session_id, summarized_through_id, oldest_recent_id)
+            if not older:
+                return
+
+            logger.info(f"Folding {len(older)} messages into summary for session {session_id}")
+            new_summary = self.summarize(summary, older)
+            db.update_session_summary(session_id, new_summary, older[-1]['id'])
+        except Exception as e:
+            logger.error(f"Failed to update conversation summary for session {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
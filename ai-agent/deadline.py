@@ -0,0 +1,52 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Remaining request budget in seconds. A relative budget is used instead of an
+# absolute timestamp so clock skew between pods doesn't matter.
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request runs out of time before a stage starts."""
+
+    def __init__(self, stage):
+        super().__init__(f"Deadline exceeded before {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    def __init__(self, budget):
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def from_headers(cls, headers, default_budget):
+        budget = default_budget
+        value = headers.get(DEADLINE_HEADER)
+        if value:
+            try:
+                budget = min(float(value), default_budget)
+            except ValueError:
+                logger.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {value}")
+        return cls(budget)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self, stage):
+        if self.expired():
+            logger.warning(f"Deadline exceeded, abandoning request before {stage}")
+            raise DeadlineExceeded(stage)
+
+    def timeout(self, cap=None):
+        """Time available to the next stage, optionally capped."""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def headers(self):
+        """Headers propagating the remaining budget to downstream calls."""
+        return {DEADLINE_HEADER: f"{self.remaining():.3f}"}
@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def health_url(endpoint_url):
+    """Tools serve /api/health next to their main endpoint."""
+    parts = urlsplit(endpoint_url)
+    return f"{parts.scheme}://{parts.netloc}/api/health"
+
+
+class FleetHealthMonitor:
+    """Probes the registry and every active tool's health endpoint on a schedule.
+
+    Results are kept in a snapshot that is replaced as a whole, so readers
+    never block and never touch the database or the tools. A tool counts as
+    unhealthy after ``failure_threshold`` consecutive failed probes; tools
+    that haven't been probed yet count as healthy.
+    """
+
+    def __init__(self, db_provider, interval=15, probe_timeout=2.0, failure_threshold=2,
+                 max_workers=8):
+        # db_provider is called on use so workers pick up their own DatabaseManager
+        self.db_provider = db_provider
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.failure_threshold = failure_threshold
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='fleet-health')
+        self._failures = {}
+        self.snapshot = None
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def is_healthy(self, tool_name):
+        snapshot = self.snapshot
+        if snapshot is None or tool_name not in snapshot['tools']:
+            return True
+        return snapshot['tools'][tool_name]['status'] == 'healthy'
+
+    def is_stale(self):
+        snapshot = self.snapshot
+        return snapshot is None or time.monotonic() - snapshot['probed_at'] > 3 * self.interval
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Fleet health refresh failed: {e}", exc_info=True)
+            time.sleep(self.interval)
+
+    def refresh(self):
+        try:
+            tools = self.db_provider().get_active_tools()
+            database = "connected"
+        except Exception as e:
+            logger.error(f"Database connection failed: {e}")
+            tools = []
+            database = f"error: {str(e)}"
+
+        probes = list(self._executor.map(self._probe, tools))
+        statuses = {}
+        for tool, (ok, detail, latency) in zip(tools, probes):
+            failures = 0 if ok else self._failures.get(tool['name'], 0) + 1
+            self._failures[tool['name']] = failures
+            status = 'unhealthy' if failures >= self.failure_threshold else 'healthy'
+            if status == 'unhealthy':
+                logger.warning(f"Tool {tool['name']} is unhealthy: {detail}")
+            statuses[tool['name']] = {
+                "status": status,
+                "consecutive_failures": failures,
+                "latency_ms": round(latency * 1000, 1),
+                "detail": detail
+            }
+        # Forget tools that are no longer registered
+        self._failures = {name: self._failures[name] for name in statuses}
+
+        self.snapshot = {
+            "database": database,
+            "tools": statuses,
+            "timestamp": datetime.now().isoformat(),
+            "probed_at": time.monotonic()
+        }
+
+    def _probe(self, tool):
+        started = time.monotonic()
+        try:
+            response = self.session.get(health_url(tool['endpoint_url']), timeout=self.probe_timeout)
+            latency = time.monotonic() - started
+            if response.status_code == 200:
+                return True, "ok", latency
+            try:
+                detail = response.json().get('error', f"status {response.status_code}")
+            except ValueError:
+                detail = f"status {response.status_code}"
+            return False, detail, latency
+        except requests.exceptions.RequestException as e:
+            return False, str(e), time.monotonic() - started
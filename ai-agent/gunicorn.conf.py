@@ -0,0 +1,52 @@
+import gc
+import multiprocessing
+import os
+
+# Production serving mode for the AI agent.
+#
+# The master imports app.py once (loading the classifier weights) and then
+# forks the workers, so the model is shared copy-on-write between them.
+# Each worker builds its own DatabaseManager after the fork because pooled
+# connections must never be shared across processes.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+preload_app = True
+
+# cpu_count() reports the host's CPUs rather than the pod's limit, and every
+# worker holds its own pools, caches and background threads
+workers = int(os.getenv('AGENT_WORKERS', '2'))
+worker_class = 'gthread'
+
+# A /api/chat request holds a thread while it runs and while it waits for
+# admission, so each worker gets enough threads for the admission limit and
+# queue plus spare ones that keep health probes and tool heartbeats from
+# queueing behind long chat requests.
+reserved_threads = int(os.getenv('AGENT_RESERVED_THREADS', '4'))
+threads = int(os.getenv('AGENT_THREADS', int(os.getenv('ADMISSION_MAX_LIMIT', '8'))
+                        + int(os.getenv('ADMISSION_MAX_QUEUE', '8')) + reserved_threads))
+timeout = int(os.getenv('AGENT_WORKER_TIMEOUT', '120'))
+graceful_timeout = int(os.getenv('AGENT_GRACEFUL_TIMEOUT', '60'))
+
+# Recycle workers gracefully; the jitter keeps them from restarting together
+max_requests = int(os.getenv('AGENT_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('AGENT_MAX_REQUESTS_JITTER', '100'))
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far (model included) out of the collector's
+    # reach so GC passes in the workers don't touch and copy those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+    import app as agent
+    from shared.db import DatabaseManager
+
+    # Split the CPUs between workers instead of every worker using all of them
+    torch.set_num_threads(max(1, multiprocessing.cpu_count() // workers))
+
+    # Replace the engine inherited from the master without touching its pool
+    agent.db = DatabaseManager(application_name='ai-agent')
+    agent.start_background_tasks()
+    server.log.info(f"Worker {worker.pid} initialized")
@@ -0,0 +1,84 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def derive_key(session_id, message, latest_message_id):
+    """Key for requests without an explicit idempotency key.
+
+    Including the session's newest stored message id means a repeated
+    message is only a duplicate until the original's answer is stored, so a
+    legitimate repeat like "yes" later in the conversation isn't replayed.
+    """
+    digest = hashlib.sha256(
+        f"{session_id}\0{latest_message_id}\0{message}".encode('utf-8')
+    ).hexdigest()
+    return f"derived:{digest}"
+
+
+def explicit_key(value):
+    """Key for a client-supplied Idempotency-Key header, bounded in length."""
+    return f"explicit:{hashlib.sha256(value.encode('utf-8')).hexdigest()}"
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class IdempotencyStore:
+    """Coalesces concurrent duplicates and replays recent results.
+
+    The first request for a key leads and computes the result. Duplicates
+    arriving while it runs wait for that result, and duplicates arriving
+    within ``ttl_seconds`` after a successful completion get it replayed.
+    This only covers one process; the agent uses it as a fast path in front
+    of the idempotency_keys table, which is shared by all workers.
+    """
+
+    LEAD, JOIN, REPLAY = 'lead', 'join', 'replay'
+
+    def __init__(self, ttl_seconds=60, max_entries=1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._in_flight = {}
+        self._completed = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Return (role, value): the in-flight entry, or the stored result to replay."""
+        with self._lock:
+            self._expire()
+            if key in self._completed:
+                return self.REPLAY, self._completed[key][0]
+            if key in self._in_flight:
+                return self.JOIN, self._in_flight[key]
+            entry = _InFlight()
+            self._in_flight[key] = entry
+            return self.LEAD, entry
+
+    def finish(self, key, entry, result, store):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if store:
+                self._completed[key] = (result, time.monotonic())
+                while len(self._completed) > self.max_entries:
+                    self._completed.popitem(last=False)
+        entry.result = result
+        entry.done.set()
+
+    def _expire(self):
+        # Completed entries are stored in completion order
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._completed:
+            key, (_, completed_at) = next(iter(self._completed.items()))
+            if completed_at >= cutoff:
+                break
+            del self._completed[key]
@@ -0,0 +1,76 @@
+import json
+import logging
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Fields that cost tokens without helping the model answer
+DROPPED_FIELDS = {"thumbnail", "success", "search_type"}
+# Keys of lists whose entries are ranked, best first, and can be cut from the end
+RANKED_LIST_FIELDS = ("results",)
+
+
+class ToolContextBuilder:
+    """Serializes tool responses compactly within a per-tool token budget."""
+
+    def __init__(self, model="gpt-4", tokens_per_tool=800, max_field_chars=300):
+        self.encoding = tiktoken.encoding_for_model(model)
+        self.tokens_per_tool = tokens_per_tool
+        self.max_field_chars = max_field_chars
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text))
+
+    def build(self, tool_responses):
+        sections = []
+        for resp in tool_responses:
+            serialized = self.serialize(resp['response'])
+            sections.append(f"{resp['tool']} returned: {serialized}")
+        return "\n".join(sections)
+
+    def serialize(self, response):
+        response = self._compact(response)
+        if isinstance(response, dict):
+            for field in RANKED_LIST_FIELDS:
+                if isinstance(response.get(field), list):
+                    return self._fit_ranked(response, field)
+        return self._fit_text(self._dumps(response))
+
+    def _fit_ranked(self, response, field):
+        # Keep as many of the top-ranked entries as fit in the budget
+        entries = response[field]
+        fitted = dict(response, **{field: []})
+        used = self.count_tokens(self._dumps(fitted))
+        for entry in entries:
+            cost = self.count_tokens(self._dumps(entry)) + 1
+            if used + cost > self.tokens_per_tool:
+                break
+            fitted[field].append(entry)
+            used += cost
+        if len(fitted[field]) < len(entries):
+            logger.info(f"Trimmed tool {field} from {len(entries)} to {len(fitted[field])} to fit "
+                        f"{self.tokens_per_tool} tokens")
+        return self._fit_text(self._dumps(fitted))
+
+    def _fit_text(self, text):
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= self.tokens_per_tool:
+            return text
+        return self.encoding.decode(tokens[:self.tokens_per_tool]) + "..."
+
+    def _compact(self, value):
+        if isinstance(value, dict):
+            return {
+                key: self._compact(item) for key, item in value.items()
+                if key not in DROPPED_FIELDS and item not in (None, "", [], {})
+            }
+        if isinstance(value, list):
+            return [self._compact(item) for item in value]
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return value[:self.max_field_chars] + "..."
+        return value
+
+    @staticmethod
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
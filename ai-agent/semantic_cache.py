@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def mean_pooled_embedding(features):
+    """Turn feature-extraction pipeline output into a unit-length vector."""
+    vectors = np.asarray(features, dtype=np.float32)
+    # Pipeline output is [batch][tokens][dim]; average over the tokens
+    vectors = vectors.reshape(-1, vectors.shape[-1])
+    embedding = vectors.mean(axis=0)
+    norm = np.linalg.norm(embedding)
+    return embedding / norm if norm else embedding
+
+
+def tool_signature(tools):
+    """Identify the set of tools a response was produced with."""
+    return tuple(sorted(tool['name'] for tool in tools))
+
+
+class SemanticCache:
+    """Bounded LRU cache of final responses keyed by message embedding.
+
+    A lookup hits when a stored message embedded under the same tool
+    signature has cosine similarity of at least ``threshold`` and has not
+    outlived ``ttl_seconds``.
+    """
+
+    def __init__(self, embed, max_entries=1000, ttl_seconds=3600, threshold=0.92):
+        self.embed = embed
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._latency_saved = 0.0
+
+    def lookup(self, embedding, signature):
+        with self._lock:
+            self._expire()
+            best_key, best_score = None, -1.0
+            for key, entry in self._entries.items():
+                if entry['signature'] != signature:
+                    continue
+                score = float(np.dot(entry['embedding'], embedding))
+                if score > best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None or best_score < self.threshold:
+                self._misses += 1
+                return None
+
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            self._hits += 1
+            self._latency_saved += entry['latency']
+            logger.info(f"Semantic cache hit with similarity {best_score:.3f}")
+            return entry['response']
+
+    def store(self, embedding, signature, response, latency):
+        with self._lock:
+            self._entries[self._next_key] = {
+                'embedding': embedding,
+                'signature': signature,
+                'response': response,
+                'latency': latency,
+                'created': time.monotonic()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": round(self._latency_saved, 3)
+            }
+
+    def _expire(self):
+        # Entries are kept in insertion/use order, but a recently used entry
+        # can still be old, so check every entry
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry['created'] < cutoff]
+        for key in expired:
+            del self._entries[key]
@@ -2,11 +2,9 @@ from flask import Flask, request, jsonify
 import re
 import math
 from shared.db import DatabaseManager
-import requests
-import time
 from datetime import datetime
+from shared.tool_sdk import ToolAgentClient
 import logging
-import threading
 
 app = Flask(__name__)
 
@@ -24,6 +22,13 @@ CAPABILITIES = [
     "convert units"
 ]
 
+agent_client = ToolAgentClient(
+    name="Calculator Tool",
+    description="Performs mathematical calculations including basic arithmetic, unit conversions, and equation solving.",
+    endpoint_url="http://calculator-tool:5000/api/calculate",
+    capabilities=CAPABILITIES
+)
+
 def extract_numbers(text):
     return [float(num) for num in re.findall(r'-?\d*\.?\d+', text)]
 
@@ -79,29 +84,6 @@ def calculate():
     result = perform_calculation(numbers, operation)
     return jsonify(result)
 
-def register_with_agent():
-    while True:
-        try:
-            logger.info("Attempting to register with AI Agent...")
-            response = requests.post(
-                'http://ai-agent:5000/api/tools/register',
-                json={
-                    "name": "Calculator Tool",
-                    "description": "Performs mathematical calculations including basic arithmetic, unit conversions, and equation solving.",
-                    "endpoint_url": "http://calculator-tool:5000/api/calculate",
-                    "capabilities": CAPABILITIES
-                },
-                timeout=5
-            )
-            if response.status_code == 200:
-                logger.info("Successfully registered with AI Agent")
-                break
-            else:
-                logger.error(f"Registration failed with status code: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to register with AI Agent: {e}")
-            time.sleep(10)  # Wait before retrying
-
 @app.route('/api/health', methods=['GET'])
 def health_check():
     try:
@@ -129,26 +111,8 @@ def health_check():
             "timestamp": datetime.now().isoformat()
         }), 500
 
-def send_heartbeat():
-    while True:
-        try:
-            logger.debug("Sending heartbeat...")
-            response = requests.post(
-                'http://ai-agent:5000/api/tools/heartbeat',
-                json={"name": "Calculator Tool"},
-                timeout=5
-            )
-            if response.status_code == 200:
-                logger.debug("Heartbeat successful")
-            else:
-                logger.warning(f"Heartbeat failed with status {response.status_code}")
-        except Exception as e:
-            logger.error(f"Error sending heartbeat: {e}")
-        time.sleep(60)  # Send heartbeat every minute
-
 if __name__ == '__main__':
-    # Start registration and heartbeat in separate threads
-    threading.Thread(target=register_with_agent, daemon=True).start()
-    threading.Thread(target=send_heartbeat, daemon=True).start()
+    # Register, heartbeat and deregister on shutdown in the background
+    agent_client.start()
     
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -1,28 +1,114 @@
 import streamlit as st
 import requests
+import threading
+import time
 import uuid
 from datetime import datetime
 
+AGENT_URL = 'http://ai-agent:5000'
+STATUS_REFRESH_SECONDS = 15
+HISTORY_PAGE_SIZE = 20
+
 # Initialize session state
-if 'messages' not in st.session_state:
-    st.session_state.messages = []
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 if 'processing' not in st.session_state:
     st.session_state.processing = False
+# Number of history pages shown and a counter that invalidates the newest page
+if 'history_pages' not in st.session_state:
+    st.session_state.history_pages = 1
+if 'history_version' not in st.session_state:
+    st.session_state.history_version = 0
+# Failed exchanges the agent never stored, shown until the user dismisses them
+if 'failed_turns' not in st.session_state:
+    st.session_state.failed_turns = []
+
+@st.cache_resource
+def get_agent_session():
+    # One pooled keep-alive session shared by every user of this server process
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=20)
+    session.mount('http://', adapter)
+    return session
+
+class StatusMonitor:
+    """Polls the agent's health endpoint in the background.
+
+    Page renders read the last snapshot instead of calling the agent.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.snapshot = None
+        threading.Thread(target=self._poll, daemon=True).start()
+
+    def _poll(self):
+        while True:
+            try:
+                response = get_agent_session().get(f'{AGENT_URL}/api/health', timeout=5)
+                self.snapshot = {"status_code": response.status_code, "details": response.json()}
+            except Exception:
+                self.snapshot = {"status_code": None, "details": None}
+            time.sleep(self.interval)
+
+@st.cache_resource
+def get_status_monitor():
+    return StatusMonitor(STATUS_REFRESH_SECONDS)
+
+@st.cache_data(ttl=300, max_entries=1000, show_spinner=False)
+def fetch_history_page(session_id, cursor, version):
+    # version is only part of the cache key; it changes after each new message
+    params = {'limit': HISTORY_PAGE_SIZE}
+    if cursor:
+        params['cursor'] = cursor
+    response = get_agent_session().get(
+        f'{AGENT_URL}/api/sessions/{session_id}/messages',
+        params=params,
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()
+
+def load_history(session_id, pages, version):
+    """Return the newest ``pages`` pages of history and whether more exist."""
+    messages = []
+    cursor = None
+    for page in range(pages):
+        # Only the newest page changes when messages are added
+        result = fetch_history_page(session_id, cursor, version if page == 0 else None)
+        messages = result['messages'] + messages
+        cursor = result['next_cursor']
+        if not cursor:
+            break
+    return messages, cursor is not None
+
+CHAT_TIMEOUT_SECONDS = 60
+# Leave the agent a little less than we wait so it gives up before we do
+CHAT_DEADLINE_MARGIN_SECONDS = 2
 
-def send_message(message):
+def send_message(message, idempotency_key):
+    # Retries of a prompt reuse its key, so if the original finished after we
+    # gave up the agent replays its answer instead of running it again
     try:
-        response = requests.post(
-            'http://ai-agent:5000/api/chat',
+        response = get_agent_session().post(
+            f'{AGENT_URL}/api/chat',
             json={
                 'message': message,
                 'session_id': st.session_state.session_id
             },
-            timeout=60
+            headers={
+                'X-Request-Timeout': str(CHAT_TIMEOUT_SECONDS - CHAT_DEADLINE_MARGIN_SECONDS),
+                'Idempotency-Key': idempotency_key
+            },
+            timeout=CHAT_TIMEOUT_SECONDS
         )
         if response.status_code == 200:
             return response.json()
+        elif response.status_code == 504:
+            return {"error": "Error: 504", "response": "Sorry, that took too long. Please try again."}
+        elif response.status_code in (429, 503):
+            retry_after = response.headers.get('Retry-After', 'a few')
+            return {"error": f"Error: {response.status_code}", "response": f"The assistant is busy right now. Please try again in {retry_after} seconds."}
         else:
             return {"error": f"Error: {response.status_code}", "response": "Sorry, I encountered an error."}
     except requests.exceptions.RequestException as e:
@@ -132,40 +218,78 @@ with st.sidebar:
     st.markdown("### Session Information")
     st.code(f"Session ID: {st.session_state.session_id}")
     st.markdown("### System Status")
-    try:
-        response = requests.get('http://ai-agent:5000/api/health', timeout=5)
-        if response.status_code == 200:
+    status = get_status_monitor().snapshot
+    if status is None:
+        st.info("Checking system status...")
+    elif status["status_code"] is None:
+        st.error("Unable to connect to AI Agent")
+    else:
+        if status["status_code"] == 200:
             st.success("All Systems Operational")
         else:
             st.warning("Some Services Degraded")
         with st.expander("Details"):
-            st.json(response.json())
-    except:
-        st.error("Unable to connect to AI Agent")
+            st.json(status["details"])
     
     if st.button("Clear Chat", use_container_width=True):
-        st.session_state.messages = []
         st.session_state.session_id = str(uuid.uuid4())
-        st.experimental_rerun()
+        st.session_state.history_pages = 1
+        st.session_state.failed_turns = []
+        st.rerun()
 
-# Display messages
-for message in st.session_state.messages:
+# Display messages, loading older pages from the agent on demand
+try:
+    history, has_more = load_history(
+        st.session_state.session_id,
+        st.session_state.history_pages,
+        st.session_state.history_version
+    )
+except requests.exceptions.RequestException:
+    history, has_more = [], False
+    st.warning("Unable to load conversation history")
+
+if has_more and st.button("Load earlier messages"):
+    st.session_state.history_pages += 1
+    st.rerun()
+
+for message in history:
     with st.chat_message(message["role"]):
         st.write(message["content"])
-        st.caption(f"Time: {message['timestamp']}")
+        timestamp = datetime.fromisoformat(message['timestamp']).strftime("%H:%M:%S")
+        st.caption(f"Time: {timestamp}")
+
+for index, turn in enumerate(st.session_state.failed_turns):
+    with st.chat_message("user"):
+        st.write(turn["prompt"])
+        st.caption(f"Time: {turn['timestamp']}")
+    with st.chat_message("assistant"):
+        st.error(turn["error"])
+        st.write(turn["response"])
+        retry_column, dismiss_column = st.columns(2)
+        if retry_column.button("Retry", key=f"retry_{turn['id']}",
+                               disabled=st.session_state.processing):
+            with st.spinner("Thinking..."):
+                response = send_message(turn["prompt"], turn["id"])
+            if "error" in response:
+                turn["error"] = response["error"]
+                turn["response"] = response["response"]
+            else:
+                # Stored (or replayed) by the agent; it now shows in the history
+                st.session_state.failed_turns.pop(index)
+                st.session_state.history_version += 1
+            st.rerun()
+        if dismiss_column.button("Dismiss", key=f"dismiss_{turn['id']}"):
+            st.session_state.failed_turns.pop(index)
+            st.rerun()
 
 # Chat input
 if prompt := st.chat_input("Type your message...", disabled=st.session_state.processing):
     if not st.session_state.processing:
         st.session_state.processing = True
         
-        # Add user message
         timestamp = datetime.now().strftime("%H:%M:%S")
-        st.session_state.messages.append({
-            "role": "user",
-            "content": prompt,
-            "timestamp": timestamp
-        })
+        # Identifies this prompt to the agent, including when it is retried
+        turn_id = str(uuid.uuid4())
         
         # Show user message immediately
         with st.chat_message("user"):
@@ -175,7 +299,7 @@ if prompt := st.chat_input("Type your message...", disabled=st.session_state.pro
         # Get AI response
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                response = send_message(prompt)
+                response = send_message(prompt, turn_id)
                 
                 if "error" in response:
                     st.error(response["error"])
@@ -184,14 +308,19 @@ if prompt := st.chat_input("Type your message...", disabled=st.session_state.pro
                     assistant_message = response["response"]
                 
                 st.write(assistant_message)
-                timestamp = datetime.now().strftime("%H:%M:%S")
-                st.caption(f"Time: {timestamp}")
+                st.caption(f"Time: {datetime.now().strftime('%H:%M:%S')}")
         
-        # Add assistant response to history
-        st.session_state.messages.append({
-            "role": "assistant",
-            "content": assistant_message,
-            "timestamp": timestamp
-        })
+        if "error" in response:
+            # The agent didn't store this exchange; keep it visible locally
+            st.session_state.failed_turns.append({
+                "id": turn_id,
+                "prompt": prompt,
+                "error": response["error"],
+                "response": assistant_message,
+                "timestamp": timestamp
+            })
+        else:
+            # The agent stored the exchange; refresh the newest history page
+            st.session_state.history_version += 1
         
         st.session_state.processing = False 
\ No newline at end of file
@@ -0,0 +1,87 @@
+"""Streaming NDJSON export of the registry's chat data.
+
+Usage:
+    python -m shared.export chat_history --since 2024-01-01 --gzip -o chat.ndjson.gz
+"""
+import argparse
+import json
+import sys
+import zlib
+from datetime import datetime
+import logging
+
+from shared.db import DatabaseManager, EXPORT_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Rows per NDJSON chunk handed to the writer
+CHUNK_ROWS = 500
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_chunks(rows, compress=False):
+    """Encode rows as NDJSON, yielding bytes chunks (gzip framed if compress)."""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, default=_json_default, ensure_ascii=False))
+        if len(lines) >= CHUNK_ROWS:
+            chunk = ("\n".join(lines) + "\n").encode('utf-8')
+            lines = []
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    if lines:
+        chunk = ("\n".join(lines) + "\n").encode('utf-8')
+        yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be positive, got {value}")
+    return number
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export registry tables as NDJSON")
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--since', type=datetime.fromisoformat,
+                        help="Only rows at or after this ISO timestamp")
+    parser.add_argument('--until', type=datetime.fromisoformat,
+                        help="Only rows before this ISO timestamp")
+    parser.add_argument('--session-id', help="Only rows of this session")
+    parser.add_argument('--batch-size', type=positive_int, default=1000,
+                        help="Rows fetched per server-side cursor round trip")
+    parser.add_argument('--gzip', action='store_true', help="Gzip-compress the output")
+    parser.add_argument('-o', '--output', help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        stream=sys.stderr
+    )
+    db = DatabaseManager(application_name='kagentic-export', pool_size=1, max_overflow=0)
+    rows = db.stream_rows(args.table, since=args.since, until=args.until,
+                          session_id=args.session_id, batch_size=args.batch_size)
+
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in ndjson_chunks(rows, compress=args.gzip):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    logger.info(f"Exported {args.table}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Idempotent schema migrations for the tool registry database.
+
+tool-registry/init.sql only runs when the database is first created, so a
+database created by an older version keeps its old schema. The AI agent
+applies these steps at startup to bring such a database up to date; on a
+current database every step is a no-op. The partition maintenance functions
+are defined here only, so fresh and upgraded databases get the same ones.
+"""
+
+# Ordered (name, statement) pairs, applied in one transaction
+SCHEMA_MIGRATIONS = [
+    # Older databases have chat_history as a plain table. It becomes the
+    # default partition of a new partitioned chat_history, so the existing
+    # rows stay readable right away; the maintenance job then moves them
+    # into daily partitions. Its old primary key and foreign key (without
+    # ON DELETE CASCADE) are replaced by the ones of the partitioned table.
+    ('partition_chat_history', """
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM pg_class
+                WHERE relname = 'chat_history'
+                AND relkind = 'r'
+                AND relnamespace = 'public'::regnamespace
+            ) THEN
+                ALTER TABLE chat_history RENAME TO chat_history_default;
+                ALTER TABLE chat_history_default DROP CONSTRAINT IF EXISTS chat_history_pkey;
+                ALTER TABLE chat_history_default
+                    DROP CONSTRAINT IF EXISTS chat_history_session_id_fkey;
+                UPDATE chat_history_default SET timestamp = CURRENT_TIMESTAMP
+                WHERE timestamp IS NULL;
+                ALTER TABLE chat_history_default ALTER COLUMN timestamp SET NOT NULL;
+
+                CREATE TABLE chat_history (
+                    id INTEGER NOT NULL DEFAULT nextval('chat_history_id_seq'),
+                    session_id VARCHAR(100) REFERENCES sessions(session_id) ON DELETE CASCADE,
+                    message TEXT NOT NULL,
+                    role VARCHAR(50) NOT NULL,
+                    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id, timestamp)
+                ) PARTITION BY RANGE (timestamp);
+                ALTER SEQUENCE chat_history_id_seq OWNED BY chat_history.id;
+                ALTER TABLE chat_history ATTACH PARTITION chat_history_default DEFAULT;
+
+                CREATE INDEX chat_history_session_idx ON chat_history (session_id, timestamp);
+                CREATE INDEX chat_history_timestamp_idx ON chat_history (timestamp);
+            END IF;
+        END
+        $$
+    """),
+    ('sessions_last_active_idx', """
+        CREATE INDEX IF NOT EXISTS sessions_last_active_idx ON sessions (last_active)
+    """),
+    ('sessions_summary', """
+        ALTER TABLE sessions
+            ADD COLUMN IF NOT EXISTS summary TEXT,
+            ADD COLUMN IF NOT EXISTS summarized_through_id INTEGER
+    """),
+    ('tools_instance_id', """
+        ALTER TABLE tools ADD COLUMN IF NOT EXISTS instance_id VARCHAR(100)
+    """),
+    ('idempotency_keys', """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key VARCHAR(100) PRIMARY KEY,
+            status VARCHAR(20) NOT NULL,
+            response_body TEXT,
+            status_code INTEGER,
+            mimetype VARCHAR(100),
+            expires_at TIMESTAMP NOT NULL
+        )
+    """),
+    # Creates the daily partitions for the next premake_days days (today
+    # included), plus partitions for any days whose rows ended up in the
+    # default partition. Such rows are moved into the new partition before
+    # it is attached; a day that still fails is skipped with a warning so the
+    # other days are not blocked.
+    ('create_chat_history_partitions', """
+        CREATE OR REPLACE FUNCTION create_chat_history_partitions(premake_days INTEGER)
+        RETURNS INTEGER AS $$
+        DECLARE
+            day DATE;
+            partition_name TEXT;
+            created INTEGER := 0;
+        BEGIN
+            FOR day IN
+                SELECT generate_series(CURRENT_DATE, CURRENT_DATE + premake_days, INTERVAL '1 day')::DATE
+                UNION
+                SELECT DISTINCT timestamp::DATE FROM chat_history_default
+                ORDER BY 1
+            LOOP
+                partition_name := 'chat_history_' || to_char(day, 'YYYYMMDD');
+                IF to_regclass(partition_name) IS NOT NULL THEN
+                    CONTINUE;
+                END IF;
+                BEGIN
+                    IF EXISTS (
+                        SELECT 1 FROM chat_history_default
+                        WHERE timestamp >= day AND timestamp < day + 1
+                    ) THEN
+                        EXECUTE format(
+                            'CREATE TABLE %I (LIKE chat_history INCLUDING DEFAULTS)',
+                            partition_name
+                        );
+                        EXECUTE format(
+                            'WITH moved AS (DELETE FROM chat_history_default
+                                            WHERE timestamp >= %L AND timestamp < %L
+                                            RETURNING *)
+                             INSERT INTO %I SELECT * FROM moved',
+                            day, day + 1, partition_name
+                        );
+                        EXECUTE format(
+                            'ALTER TABLE chat_history ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                            partition_name, day, day + 1
+                        );
+                    ELSE
+                        EXECUTE format(
+                            'CREATE TABLE %I PARTITION OF chat_history FOR VALUES FROM (%L) TO (%L)',
+                            partition_name, day, day + 1
+                        );
+                    END IF;
+                    created := created + 1;
+                EXCEPTION WHEN OTHERS THEN
+                    RAISE WARNING 'Could not create partition %: %', partition_name, SQLERRM;
+                END;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql
+    """),
+    # Drops daily partitions whose whole range is older than retention_days
+    ('drop_chat_history_partitions', """
+        CREATE OR REPLACE FUNCTION drop_chat_history_partitions(retention_days INTEGER)
+        RETURNS INTEGER AS $$
+        DECLARE
+            part RECORD;
+            dropped INTEGER := 0;
+        BEGIN
+            FOR part IN
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = 'chat_history'
+                AND c.relname ~ '^chat_history_[0-9]{8}$'
+            LOOP
+                IF to_date(substring(part.relname from 14), 'YYYYMMDD') + 1
+                        <= CURRENT_DATE - retention_days THEN
+                    EXECUTE format('DROP TABLE %I', part.relname);
+                    dropped := dropped + 1;
+                END IF;
+            END LOOP;
+            -- Expired rows that never made it out of the default partition
+            DELETE FROM chat_history_default
+            WHERE timestamp < CURRENT_DATE - retention_days;
+            RETURN dropped;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+]
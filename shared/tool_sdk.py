@@ -0,0 +1,129 @@
+import os
+import random
+import signal
+import sys
+import atexit
+import threading
+import uuid
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class ToolAgentClient:
+    """Keeps a tool registered with the AI agent.
+
+    Registration is retried with exponential backoff and full jitter, so a
+    fleet restarting during an agent outage doesn't stampede the agent.
+    Heartbeats reuse one keep-alive session. The tool registers again when
+    the agent no longer knows it or has been unreachable, and it deregisters
+    on shutdown. Each client has its own instance id, so an old pod shutting
+    down during a rolling update doesn't deregister its replacement.
+    """
+
+    def __init__(self, name, description, endpoint_url, capabilities,
+                 agent_url=None, heartbeat_interval=60,
+                 backoff_base=1.0, backoff_max=60.0):
+        self.name = name
+        self.description = description
+        self.endpoint_url = endpoint_url
+        self.capabilities = capabilities
+        self.agent_url = agent_url or os.getenv('AGENT_URL', 'http://ai-agent:5000')
+        self.heartbeat_interval = heartbeat_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.instance_id = uuid.uuid4().hex
+        self.session = requests.Session()
+        self._registered = False
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Register and heartbeat in the background; call from the main thread."""
+        atexit.register(self.stop)
+        signal.signal(signal.SIGTERM, self._handle_sigterm)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._registered:
+            self.deregister()
+
+    def register(self):
+        logger.info("Attempting to register with AI Agent...")
+        response = self.session.post(
+            f'{self.agent_url}/api/tools/register',
+            json={
+                "name": self.name,
+                "description": self.description,
+                "endpoint_url": self.endpoint_url,
+                "capabilities": self.capabilities,
+                "instance_id": self.instance_id
+            },
+            timeout=5
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Registration failed with status code: {response.status_code}")
+        self._registered = True
+        logger.info("Successfully registered with AI Agent")
+
+    def heartbeat(self):
+        logger.debug("Sending heartbeat...")
+        response = self.session.post(
+            f'{self.agent_url}/api/tools/heartbeat',
+            json={"name": self.name},
+            timeout=5
+        )
+        if response.status_code == 404:
+            logger.warning("AI Agent no longer knows this tool, registering again")
+            self._registered = False
+        elif response.status_code != 200:
+            logger.warning(f"Heartbeat failed with status {response.status_code}")
+        else:
+            logger.debug("Heartbeat successful")
+
+    def deregister(self):
+        try:
+            logger.info("Deregistering from AI Agent...")
+            self.session.post(
+                f'{self.agent_url}/api/tools/deregister',
+                json={"name": self.name, "instance_id": self.instance_id},
+                timeout=2
+            )
+            self._registered = False
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to deregister from AI Agent: {e}")
+
+    def _run(self):
+        attempt = 0
+        while not self._stopped.is_set():
+            if not self._registered:
+                try:
+                    self.register()
+                    attempt = 0
+                except (requests.exceptions.RequestException, RuntimeError) as e:
+                    logger.error(f"Failed to register with AI Agent: {e}")
+                    self._stopped.wait(self._backoff(attempt))
+                    attempt += 1
+                    continue
+
+            self._stopped.wait(self.heartbeat_interval * random.uniform(0.9, 1.1))
+            if self._stopped.is_set():
+                break
+            try:
+                self.heartbeat()
+            except requests.exceptions.RequestException as e:
+                # The agent may come back with a fresh registry
+                logger.error(f"Error sending heartbeat: {e}")
+                self._registered = False
+
+    def _backoff(self, attempt):
+        # Clamp the exponent; 2 ** attempt overflows a float after a long outage
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** min(attempt, 16)))
+
+    def _handle_sigterm(self, signum, frame):
+        self.stop()
+        sys.exit(0)
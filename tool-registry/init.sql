@@ -7,6 +7,8 @@ CREATE TABLE tools (
     status VARCHAR(50) DEFAULT 'active',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_heartbeat TIMESTAMP,
+    -- Instance that registered last; only it may deregister the tool
+    instance_id VARCHAR(100),
     UNIQUE(name)
 );
 
@@ -15,13 +17,45 @@ CREATE TABLE sessions (
     session_id VARCHAR(100) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Rolling summary of the conversation up to and including chat_history
+    -- row summarized_through_id; newer turns are replayed verbatim
+    summary TEXT,
+    summarized_through_id INTEGER,
     UNIQUE(session_id)
 );
 
+CREATE INDEX sessions_last_active_idx ON sessions (last_active);
+
+-- chat_history is range partitioned by day on timestamp so expired data is
+-- removed by dropping whole partitions instead of row-by-row deletes.
+-- The primary key has to include the partition key.
 CREATE TABLE chat_history (
-    id SERIAL PRIMARY KEY,
-    session_id VARCHAR(100) REFERENCES sessions(session_id),
+    id SERIAL,
+    session_id VARCHAR(100) REFERENCES sessions(session_id) ON DELETE CASCADE,
     message TEXT NOT NULL,
     role VARCHAR(50) NOT NULL,
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-); 
\ No newline at end of file
+    timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, timestamp)
+) PARTITION BY RANGE (timestamp);
+
+CREATE INDEX chat_history_session_idx ON chat_history (session_id, timestamp);
+CREATE INDEX chat_history_timestamp_idx ON chat_history (timestamp);
+
+-- Catches rows that fall outside the pre-created partitions
+CREATE TABLE chat_history_default PARTITION OF chat_history DEFAULT;
+
+-- Claims on /api/chat idempotency keys, shared by all agent workers. A row is
+-- in_progress while one worker computes the response and completed once the
+-- response is stored for replay; expired rows can be claimed again.
+CREATE TABLE idempotency_keys (
+    key VARCHAR(100) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL,
+    response_body TEXT,
+    status_code INTEGER,
+    mimetype VARCHAR(100),
+    expires_at TIMESTAMP NOT NULL
+);
+
+-- The partition maintenance functions are created by the AI agent at startup
+-- (shared/schema.py), together with upgrades of databases created by older
+-- versions of this file. Its maintenance job then creates the partitions.
@@ -1,11 +1,10 @@
 from flask import Flask, request, jsonify
 import requests
-import time
 import os
 from typing import Optional, Dict, Any
 import logging
 from datetime import datetime
-import threading
+from shared.tool_sdk import ToolAgentClient
 
 app = Flask(__name__)
 
@@ -26,6 +25,13 @@ CAPABILITIES = [
     "research"
 ]
 
+agent_client = ToolAgentClient(
+    name="Advanced Search Tool",
+    description="Multi-purpose search tool that can find web pages, news, images, and videos using multiple search engines.",
+    endpoint_url="http://search-tool:5000/api/search",
+    capabilities=CAPABILITIES
+)
+
 SEARCH_API_KEY = os.getenv('SEARCH_API_KEY', 'your-api-key-here')
 BASE_URL = "https://www.searchapi.io/api/v1/search"
 
@@ -135,46 +141,6 @@ def search():
     results = perform_search(data['query'], search_type)
     return jsonify(results)
 
-def register_with_agent():
-    while True:
-        try:
-            logger.info("Attempting to register with AI Agent...")
-            response = requests.post(
-                'http://ai-agent:5000/api/tools/register',
-                json={
-                    "name": "Advanced Search Tool",
-                    "description": "Multi-purpose search tool that can find web pages, news, images, and videos using multiple search engines.",
-                    "endpoint_url": "http://search-tool:5000/api/search",
-                    "capabilities": CAPABILITIES
-                },
-                timeout=5
-            )
-            if response.status_code == 200:
-                logger.info("Successfully registered with AI Agent")
-                break
-            else:
-                logger.error(f"Registration failed with status code: {response.status_code}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to register with AI Agent: {e}")
-            time.sleep(10)
-
-def send_heartbeat():
-    while True:
-        try:
-            logger.debug("Sending heartbeat...")
-            response = requests.post(
-                'http://ai-agent:5000/api/tools/heartbeat',
-                json={"name": "Advanced Search Tool"},
-                timeout=5
-            )
-            if response.status_code == 200:
-                logger.debug("Heartbeat successful")
-            else:
-                logger.warning(f"Heartbeat failed with status {response.status_code}")
-        except Exception as e:
-            logger.error(f"Error sending heartbeat: {e}")
-        time.sleep(60)  # Send heartbeat every minute
-
 @app.route('/api/health', methods=['GET'])
 def health_check():
     try:
@@ -202,8 +168,7 @@ def health_check():
         }), 500
 
 if __name__ == '__main__':
-    # Start registration and heartbeat in separate threads
-    threading.Thread(target=register_with_agent, daemon=True).start()
-    threading.Thread(target=send_heartbeat, daemon=True).start()
+    # Register, heartbeat and deregister on shutdown in the background
+    agent_client.start()
     
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file